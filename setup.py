@@ -73,7 +73,6 @@ def check_dependencies():
     """Check if required dependencies are installed."""
     try:
         import telethon
-        import aiofiles
         from dotenv import load_dotenv
         print("✅ All required dependencies are installed!")
         return True
@@ -7,60 +7,419 @@ including text messages, media files, voice messages, and other attachments.
 """
 
 import asyncio
+import errno
+import glob
 import os
 import json
 import logging
+import queue
+from collections import deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 
-import aiofiles
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
+from telethon.errors import RPCError, TakeoutInitDelayError
+from telethon.tl.functions import InvokeWithTakeoutRequest
+from telethon.tl.functions.account import FinishTakeoutSessionRequest
+from telethon.tl.functions.upload import GetFileRequest
+from telethon.tl.types.upload import File as UploadFile
 from telethon.tl.types import (
     MessageMediaDocument, MessageMediaPhoto,
     DocumentAttributeAudio, DocumentAttributeVideo, DocumentAttributeSticker,
     DocumentAttributeAnimated, DocumentAttributeFilename,
+    PhotoSize, PhotoSizeProgressive, PhotoStrippedSize, PhotoCachedSize, PhotoPathSize, VideoSize,
     User, Chat, Channel
 )
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:  # Fall back to the (slower) standard library serializer
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('telegram_export.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
-class TelegramExporter:
-    def __init__(self):
-        self.api_id = os.getenv('API_ID')
-        self.api_hash = os.getenv('API_HASH')
-        self.phone_number = os.getenv('PHONE_NUMBER')
-        self.session_name = os.getenv('SESSION_NAME', 'telegram_session')
+def setup_logging() -> QueueListener:
+    """Configure logging for an export run and return the started listener."""
+    log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler('telegram_export.log', maxBytes=10_000_000, backupCount=3)
+    file_handler.setFormatter(log_formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.WARNING)  # Progress goes to the log file only
+    console_handler.setFormatter(log_formatter)
+    
+    # Log I/O happens on the listener's thread, never on the event loop
+    log_queue = queue.Queue(-1)
+    log_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    log_listener.start()
+    logging.getLogger().addHandler(QueueHandler(log_queue))
+    logging.getLogger().setLevel(logging.INFO)
+    return log_listener
+
+
+@dataclass(frozen=True)
+class Config:
+    """Settings read from the environment."""
+    api_id: int
+    api_hash: str
+    phone_number: str
+    session_name: str
+    download_concurrency: int
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Read and validate the environment configuration once per process."""
+    api_id = os.getenv('API_ID')
+    api_hash = os.getenv('API_HASH')
+    phone_number = os.getenv('PHONE_NUMBER')
+    
+    if not all([api_id, api_hash, phone_number]):
+        raise ValueError("Missing required environment variables. Check your .env file.")
+    if not api_id.isdigit():
+        raise ValueError("API_ID should be a number. Check your .env file.")
+    
+    download_concurrency = os.getenv('DOWNLOAD_CONCURRENCY', '12')
+    if not download_concurrency.isdigit() or int(download_concurrency) < 1:
+        raise ValueError("DOWNLOAD_CONCURRENCY should be a number of at least 1. Check your .env file.")
+    
+    return Config(
+        api_id=int(api_id),
+        api_hash=api_hash,
+        phone_number=phone_number,
+        session_name=os.getenv('SESSION_NAME', 'telegram_session'),
+        download_concurrency=int(download_concurrency)
+    )
+
+
+@dataclass
+class _DocumentAttributes:
+    """Media type and file name collected while scanning a document's attributes."""
+    media_info: Dict[str, Any]
+    filename: str
+
+
+def _handle_audio(attrs: _DocumentAttributes, attr: DocumentAttributeAudio) -> None:
+    if getattr(attr, 'voice', False):
+        attrs.media_info["type"] = "voice"
+    else:
+        attrs.media_info["type"] = "audio"
+
+
+def _handle_video(attrs: _DocumentAttributes, attr: DocumentAttributeVideo) -> None:
+    attrs.media_info["type"] = "video"
+
+
+def _handle_sticker(attrs: _DocumentAttributes, attr: DocumentAttributeSticker) -> None:
+    attrs.media_info["type"] = "sticker"
+
+
+def _handle_animated(attrs: _DocumentAttributes, attr: DocumentAttributeAnimated) -> None:
+    if attrs.media_info["type"] == "unknown":
+        attrs.media_info["type"] = "animated"
+
+
+def _handle_filename(attrs: _DocumentAttributes, attr: DocumentAttributeFilename) -> None:
+    if attr.file_name:
+        attrs.filename = attr.file_name
+
+
+# Dispatch on the exact attribute type instead of a chain of isinstance checks
+_ATTR_HANDLERS = {
+    DocumentAttributeAudio: _handle_audio,
+    DocumentAttributeVideo: _handle_video,
+    DocumentAttributeSticker: _handle_sticker,
+    DocumentAttributeAnimated: _handle_animated,
+    DocumentAttributeFilename: _handle_filename,
+}
+
+# Media subdirectories of an export directory, created as files are saved into them
+EXPORT_SUBDIRS = ("media", "voice", "documents", "photos", "videos", "stickers")
+
+# Subdirectory, extension and file name prefix for each document media type;
+# anything else is saved as a regular document under its original name
+_SUBDIR_EXT = {
+    "voice": ("voice", "ogg", "voice"),
+    "audio": ("media", "mp3", "audio"),
+    "video": ("videos", "mp4", "video"),
+    "sticker": ("stickers", "webp", "sticker"),
+    "animated": ("media", "gif", "animated"),
+}
+
+# Unfinished exports keep their resume state in this file, written every
+# CHECKPOINT_INTERVAL messages
+CHECKPOINT_FILE = ".checkpoint.json"
+CHECKPOINT_INTERVAL = 500
+
+# Largest file a takeout session is allowed to download (Telegram's 4 GB limit)
+TAKEOUT_MAX_FILE_SIZE = 4 * 1024 ** 3
+
+# errno values meaning posix_fallocate is not supported by the platform or filesystem
+_FALLOCATE_UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOSYS}
+
+# Chunk size for parallel downloads; Telegram requires it to divide 1 MB
+DOWNLOAD_CHUNK_SIZE = 512 * 1024
+
+
+def _photo_size_rank(size: Any) -> tuple:
+    """Rank a photo size the way Telethon does when picking which one to download.
+    
+    Video sizes (animated profile photos) beat image sizes, then larger beats
+    smaller; the second element is the size in bytes.
+    """
+    if isinstance(size, (PhotoStrippedSize, PhotoCachedSize)):
+        return 1, len(size.bytes)
+    if isinstance(size, PhotoSize):
+        return 1, size.size
+    if isinstance(size, PhotoSizeProgressive):
+        return 1, max(size.sizes)
+    if isinstance(size, VideoSize):
+        return 2, size.size
+    return 0, 0
+
+
+def _photo_file_size(photo: Any) -> Optional[int]:
+    """Return the byte size of the version of a photo that Telethon downloads."""
+    sizes = [
+        size for size in (getattr(photo, 'sizes', None) or []) + (getattr(photo, 'video_sizes', None) or [])
+        if not isinstance(size, PhotoPathSize)
+    ]
+    if not sizes:
+        return None
+    return _photo_size_rank(max(sizes, key=_photo_size_rank))[1] or None
+
+
+@lru_cache(maxsize=None)
+def _ensure_dir(path: str) -> str:
+    """Create a directory once per process and return its path."""
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve disk space for the whole file so chunks can be written at any offset."""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            # Only fall back when fallocate is unsupported; a full disk must fail here
+            if e.errno not in _FALLOCATE_UNSUPPORTED:
+                raise
+            logger.debug(f"posix_fallocate not supported, extending file instead: {e}")
+    # No fallocate (macOS, Windows, some filesystems): extend the file sparsely
+    os.ftruncate(fd, size)
+
+
+def _pwrite(fd: int, data: bytes, offset: int) -> None:
+    """Write data at a given offset, falling back to seek+write where pwrite is missing."""
+    if hasattr(os, 'pwrite'):
+        os.pwrite(fd, data, offset)
+    else:
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data)
+
+
+def _json_default(obj: Any) -> Any:
+    """Serialize Telethon objects (e.g. peers in forward info) that JSON can't handle natively."""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    return str(obj)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+def load_checkpoint(export_dir: Path) -> Optional[Dict[str, Any]]:
+    """Read the resume checkpoint of an unfinished export, if there is one."""
+    try:
+        with open(export_dir / CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _checkpoint_is_usable(export_dir: Path, checkpoint: Dict[str, Any]) -> bool:
+    """Check that a checkpoint is complete and its output files can be truncated back to it."""
+    for key in ("last_id", "count", "json_offset", "text_offset"):
+        if not isinstance(checkpoint.get(key), int):
+            return False
+    if not (checkpoint.get("limit") is None or isinstance(checkpoint["limit"], int)):
+        return False
+    for name, offset in (("conversation.json", checkpoint["json_offset"]), ("conversation.txt", checkpoint["text_offset"])):
+        path = export_dir / name
+        if not path.is_file() or path.stat().st_size < offset:
+            return False
+    return True
+
+
+class ConversationWriter:
+    """Stream messages, in chronological order, to conversation.json and conversation.txt."""
+    
+    def __init__(self, export_dir: Path, conversation_info: Dict[str, Any],
+                 checkpoint: Optional[Dict[str, Any]] = None):
+        self.entity_name = conversation_info["entity_name"]
+        self.checkpoint_file = export_dir / CHECKPOINT_FILE
+        json_path = export_dir / "conversation.json"
+        text_path = export_dir / "conversation.txt"
         
-        if not all([self.api_id, self.api_hash, self.phone_number]):
-            raise ValueError("Missing required environment variables. Check your .env file.")
+        if checkpoint:
+            # Resume: discard anything written after the checkpoint and append
+            os.truncate(json_path, checkpoint["json_offset"])
+            os.truncate(text_path, checkpoint["text_offset"])
+            self.json_file = open(json_path, 'ab')
+            self.text_file = open(text_path, 'a', encoding='utf-8')
+            self.message_count = checkpoint["count"]
+            self.last_id = checkpoint["last_id"]
+            return
+        
+        self.message_count = 0
+        self.last_id = 0
+        self.json_file = open(json_path, 'wb')
+        self.text_file = open(text_path, 'w', encoding='utf-8')
         
-        self.client = None  # Will be created when needed
+        self.json_file.write(b"{\n")
+        for key, value in conversation_info.items():
+            self.json_file.write(b"  " + _json_dumps(key) + b": " + _json_dumps(value) + b",\n")
+        self.json_file.write(b'  "messages": [')
+        
+        self.text_file.write(f"Conversation with: {self.entity_name}\n")
+        self.text_file.write(f"Exported on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.text_file.write("-" * 50 + "\n\n")
+    
+    def write_message(self, msg: Dict[str, Any]) -> None:
+        """Append a single message to both output files."""
+        separator = b",\n    " if self.message_count else b"\n    "
+        self.json_file.write(separator + _json_dumps(msg))
+        self.message_count += 1
+        self.last_id = msg['id']
+        
+        date_str = datetime.fromisoformat(msg['date']).strftime('%Y-%m-%d %H:%M:%S') if msg['date'] else 'Unknown'
+        sender = "You" if msg['is_outgoing'] else self.entity_name
+        
+        self.text_file.write(f"[{date_str}] {sender}: {msg['text']}\n")
+        
+        if msg['media']:
+            self.text_file.write(f"    📎 Media: {msg['media']['type']} - {msg['media']['file_name']}\n")
+        
+        if msg['reply_to']:
+            self.text_file.write(f"    ↩️ Reply to message ID: {msg['reply_to']}\n")
+        
+        self.text_file.write("\n")
+    
+    def save_checkpoint(self, **extra: Any) -> None:
+        """Flush the output files and atomically record how far the export got."""
+        self.json_file.flush()
+        self.text_file.flush()
+        checkpoint = {
+            "last_id": self.last_id,
+            "count": self.message_count,
+            "json_offset": os.fstat(self.json_file.fileno()).st_size,
+            "text_offset": os.fstat(self.text_file.fileno()).st_size,
+            **extra
+        }
+        tmp_file = self.checkpoint_file.with_suffix(".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_file, self.checkpoint_file)
+    
+    def close(self, completed: bool = True) -> None:
+        """Write the closing sections (unless the export failed) and close the files."""
+        if completed:
+            self.json_file.write(f'\n  ],\n  "total_messages": {self.message_count}\n}}\n'.encode())
+            self.text_file.write("-" * 50 + "\n")
+            self.text_file.write(f"Total messages: {self.message_count}\n")
+        self.json_file.close()
+        self.text_file.close()
+        if completed and self.checkpoint_file.exists():
+            self.checkpoint_file.unlink()
+
+
+async def fast_download(client: TelegramClient, location: Any, file: str, size: int,
+                        n_workers: int = 8, request_semaphore: Optional[asyncio.Semaphore] = None) -> None:
+    """Download a document into `file` by fetching its chunks in parallel."""
+    dc_id, input_location = utils.get_input_location(location)
+    exported = dc_id is not None and dc_id != client.session.dc_id
+    # A shared semaphore caps chunk requests in flight across all downloads
+    if request_semaphore is None:
+        request_semaphore = asyncio.Semaphore(n_workers)
+    
+    part_file = f"{file}.part"
+    fd = os.open(part_file, os.O_CREAT | os.O_WRONLY | getattr(os, 'O_BINARY', 0), 0o644)
+    offsets = iter(range(0, size, DOWNLOAD_CHUNK_SIZE))
+    sender = None
+    
+    async def worker():
+        for offset in offsets:
+            request = GetFileRequest(input_location, offset=offset, limit=DOWNLOAD_CHUNK_SIZE)
+            async with request_semaphore:
+                # Home DC requests go through client() so takeout sessions can wrap them
+                result = await (client._call(sender, request) if exported else client(request))
+            if not isinstance(result, UploadFile):
+                raise ValueError(f"Unexpected response for chunk at offset {offset}: {type(result).__name__}")
+            _pwrite(fd, result.bytes, offset)
+    
+    workers = []
+    try:
+        sender = await client._borrow_exported_sender(dc_id) if exported else client._sender
+        # Emulated fallocate writes every block, so keep it off the event loop
+        await asyncio.to_thread(_preallocate, fd, size)
+        chunk_count = -(-size // DOWNLOAD_CHUNK_SIZE)
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(n_workers, chunk_count)))]
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        os.close(fd)
+        os.remove(part_file)
+        raise
+    finally:
+        if exported and sender is not None:
+            await client._return_exported_sender(sender)
+    
+    os.close(fd)
+    os.replace(part_file, file)
+
+
+class TelegramExporter:
+    def __init__(self):
+        self.config = get_config()
+        self.client = None  # Created by connect()
+        self._dialog_index: Optional[Dict[str, Any]] = None  # Built on first dialog search
+        self._subdir_paths: Dict[str, str] = {}
+        self._bytes_downloaded = 0  # Running total, reported with export progress
+        self._request_semaphore: Optional[asyncio.Semaphore] = None  # Caps chunk requests during an export
     
     def _create_client(self):
         """Create the Telegram client if it doesn't exist."""
         if self.client is None:
-            self.client = TelegramClient(self.session_name, int(self.api_id), self.api_hash)
+            self.client = TelegramClient(self.config.session_name, self.config.api_id, self.config.api_hash)
+        return self.client
+    
+    def _require_client(self) -> TelegramClient:
+        """Return the connected client, failing fast if connect() was never called."""
+        if self.client is None:
+            raise RuntimeError("Not connected to Telegram. Call connect() first.")
         return self.client
         
     async def connect(self):
         """Connect to Telegram and authenticate if necessary."""
         self._create_client()
-        await self.client.start(phone=self.phone_number)
+        await self.client.start(phone=self.config.phone_number)
         logger.info("Connected to Telegram successfully")
         
     async def disconnect(self):
@@ -69,10 +428,35 @@ class TelegramExporter:
             await self.client.disconnect()
         logger.info("Disconnected from Telegram")
         
+    async def _build_dialog_index(self, client: TelegramClient) -> Dict[str, Any]:
+        """Index all dialogs by username, phone number, and name (lowercased)."""
+        index = {}
+        async for dialog in client.iter_dialogs():
+            entity = dialog.entity
+            keys = []
+            
+            if getattr(entity, 'username', None):
+                keys.append(entity.username.lower())
+            if getattr(entity, 'phone', None):
+                keys.append(entity.phone)
+            if hasattr(entity, 'first_name'):
+                full_name = f"{entity.first_name or ''} {getattr(entity, 'last_name', '') or ''}".strip()
+                if full_name:
+                    keys.append(full_name.lower())
+            if getattr(entity, 'title', None):
+                keys.append(entity.title.lower())
+            
+            # Earlier (more recent) dialogs win on name collisions
+            for key in keys:
+                index.setdefault(key, entity)
+        
+        logger.info(f"Indexed {len(index)} dialog identifiers")
+        return index
+    
     async def find_conversation(self, query: str) -> Optional[Any]:
         """Find a conversation by username, phone number, or name."""
         logger.info(f"Searching for conversation: {query}")
-        client = self._create_client()
+        client = self._require_client()
         
         # Try to find by username first
         try:
@@ -82,20 +466,12 @@ class TelegramExporter:
             logger.debug(f"Could not find by username: {e}")
         
         # Search through dialogs
-        async for dialog in client.iter_dialogs():
-            entity = dialog.entity
-            
-            # Check different identifier types
-            if hasattr(entity, 'username') and entity.username and entity.username.lower() == query.lower():
-                return entity
-            elif hasattr(entity, 'phone') and entity.phone and entity.phone == query.replace('+', ''):
-                return entity
-            elif hasattr(entity, 'first_name'):
-                full_name = f"{entity.first_name or ''} {getattr(entity, 'last_name', '') or ''}".strip()
-                if full_name.lower() == query.lower():
-                    return entity
-            elif hasattr(entity, 'title') and entity.title and entity.title.lower() == query.lower():
-                return entity
+        if self._dialog_index is None:
+            self._dialog_index = await self._build_dialog_index(client)
+        
+        entity = self._dialog_index.get(query.lower()) or self._dialog_index.get(query.replace('+', ''))
+        if entity:
+            return entity
         
         logger.error(f"Could not find conversation for: {query}")
         return None
@@ -105,18 +481,34 @@ class TelegramExporter:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_dir = Path(f"exports/{entity_name}_{timestamp}")
         
-        # Create subdirectories
-        (base_dir / "messages").mkdir(parents=True, exist_ok=True)
-        (base_dir / "media").mkdir(parents=True, exist_ok=True)
-        (base_dir / "voice").mkdir(parents=True, exist_ok=True)
-        (base_dir / "documents").mkdir(parents=True, exist_ok=True)
-        (base_dir / "photos").mkdir(parents=True, exist_ok=True)
-        (base_dir / "videos").mkdir(parents=True, exist_ok=True)
-        (base_dir / "stickers").mkdir(parents=True, exist_ok=True)
+        # Subdirectories are created on first use by _ensure_subdir
+        base_dir.mkdir(parents=True, exist_ok=True)
+        self._set_export_dir(base_dir)
         
         logger.info(f"Created export directory: {base_dir}")
         return base_dir
     
+    def find_resumable_export(self, entity_name: str, entity_id: int) -> Optional[Path]:
+        """Find the most recent unfinished export of an entity that can be resumed."""
+        for checkpoint_file in sorted(Path("exports").glob(f"{glob.escape(entity_name)}_*/{CHECKPOINT_FILE}"), reverse=True):
+            export_dir = checkpoint_file.parent
+            checkpoint = load_checkpoint(export_dir)
+            if not checkpoint or checkpoint.get("entity_id") != entity_id:
+                continue
+            if _checkpoint_is_usable(export_dir, checkpoint):
+                return export_dir
+            logger.warning(f"Ignoring unusable checkpoint in {export_dir}")
+        return None
+    
+    def _set_export_dir(self, export_dir: Path):
+        """Keep plain string paths around for building media file paths."""
+        export_dir_str = str(export_dir)
+        self._subdir_paths = {subdir: os.path.join(export_dir_str, subdir) for subdir in EXPORT_SUBDIRS}
+    
+    def _ensure_subdir(self, name: str) -> str:
+        """Return the path of an export subdirectory, creating it on first use."""
+        return _ensure_dir(self._subdir_paths[name])
+    
     def get_entity_name(self, entity: Any) -> str:
         """Get a suitable name for the entity."""
         if isinstance(entity, User):
@@ -127,8 +519,8 @@ class TelegramExporter:
         else:
             return f"entity_{entity.id}"
     
-    async def download_media(self, message: Any, export_dir: Path) -> Optional[Dict[str, Any]]:
-        """Download media from a message and return file info."""
+    async def download_media(self, message: Any, *, client: Any = None) -> Optional[Dict[str, Any]]:
+        """Download media from a message into the current export directory and return file info."""
         if not message.media:
             return None
         
@@ -143,84 +535,60 @@ class TelegramExporter:
         try:
             if isinstance(message.media, MessageMediaPhoto):
                 media_info["type"] = "photo"
-                file_path = export_dir / "photos" / f"photo_{message.id}.jpg"
+                media_info["file_size"] = _photo_file_size(message.media.photo)
+                subdir = "photos"
+                file_name = f"photo_{message.id}.jpg"
                 
             elif isinstance(message.media, MessageMediaDocument):
                 document = message.media.document
                 media_info["mime_type"] = getattr(document, 'mime_type', None)
+                media_info["file_size"] = getattr(document, 'size', None)
                 
                 # Determine media type from document attributes
-                is_voice = False
-                is_audio = False
-                is_video = False
-                is_sticker = False
-                is_animated = False
-                filename = f"file_{message.id}"
-                
+                attrs = _DocumentAttributes(media_info, filename=f"file_{message.id}")
                 for attr in document.attributes:
-                    if isinstance(attr, DocumentAttributeAudio):
-                        if getattr(attr, 'voice', False):
-                            is_voice = True
-                            media_info["type"] = "voice"
-                        else:
-                            is_audio = True
-                            media_info["type"] = "audio"
-                    elif isinstance(attr, DocumentAttributeVideo):
-                        is_video = True
-                        media_info["type"] = "video"
-                    elif isinstance(attr, DocumentAttributeSticker):
-                        is_sticker = True
-                        media_info["type"] = "sticker"
-                    elif isinstance(attr, DocumentAttributeAnimated):
-                        is_animated = True
-                        if media_info["type"] == "unknown":
-                            media_info["type"] = "animated"
-                    elif isinstance(attr, DocumentAttributeFilename):
-                        if attr.file_name:
-                            filename = attr.file_name
+                    handler = _ATTR_HANDLERS.get(type(attr))
+                    if handler:
+                        handler(attrs, attr)
                 
                 # Determine file extension and subdirectory
-                if is_voice:
-                    ext = "ogg"
-                    subdir = "voice"
-                    file_path = export_dir / subdir / f"voice_{message.id}.{ext}"
-                elif is_audio:
-                    ext = "mp3"
-                    subdir = "media"
-                    file_path = export_dir / subdir / f"audio_{message.id}.{ext}"
-                elif is_video:
-                    ext = "mp4"
-                    subdir = "videos"
-                    file_path = export_dir / subdir / f"video_{message.id}.{ext}"
-                elif is_sticker:
-                    ext = "webp"
-                    subdir = "stickers"
-                    file_path = export_dir / subdir / f"sticker_{message.id}.{ext}"
-                elif is_animated:
-                    ext = "gif"
-                    subdir = "media"
-                    file_path = export_dir / subdir / f"animated_{message.id}.{ext}"
+                if media_info["type"] in _SUBDIR_EXT:
+                    subdir, ext, prefix = _SUBDIR_EXT[media_info["type"]]
+                    file_name = f"{prefix}_{message.id}.{ext}"
                 else:
                     # Regular document
                     media_info["type"] = "document"
                     subdir = "documents"
-                    file_path = export_dir / subdir / f"{message.id}_{filename}"
+                    file_name = f"{message.id}_{attrs.filename}"
             
             else:
                 # Other media types (contacts, locations, etc.)
                 media_info["type"] = "other"
                 subdir = "media"
-                file_path = export_dir / subdir / f"media_{message.id}"
+                file_name = f"media_{message.id}"
             
-            # Download the file
-            if 'file_path' in locals():
-                logger.info(f"Downloading {media_info['type']}: {file_path.name}")
-                client = self._create_client()
-                await client.download_media(message.media, str(file_path))
-                
-                media_info["file_path"] = str(file_path.relative_to(export_dir))
-                media_info["file_name"] = file_path.name
-                media_info["file_size"] = file_path.stat().st_size if file_path.exists() else None
+            # Download the file, unless a previous run already saved it in full
+            file_path = os.path.join(self._ensure_subdir(subdir), file_name)
+            expected_size = media_info["file_size"]
+            client = client or self.client  # May be a takeout session
+            document = getattr(message.media, 'document', None)
+            if expected_size and os.path.exists(file_path) and os.path.getsize(file_path) == expected_size:
+                logger.debug(f"Skipping already downloaded {media_info['type']}: {file_name}")
+            else:
+                logger.debug(f"Downloading {media_info['type']}: {file_name}")
+                if document is not None and document.size:
+                    try:
+                        await fast_download(client, document, file_path, document.size,
+                                            request_semaphore=self._request_semaphore)
+                    except Exception as e:
+                        logger.debug(f"Parallel download failed for message {message.id}, retrying: {e}")
+                        await client.download_media(message.media, file_path)
+                else:
+                    await client.download_media(message.media, file_path)
+                self._bytes_downloaded += expected_size or 0
+            
+            media_info["file_path"] = os.path.join(subdir, file_name)
+            media_info["file_name"] = file_name
                 
         except Exception as e:
             logger.error(f"Error downloading media for message {message.id}: {e}")
@@ -228,19 +596,113 @@ class TelegramExporter:
         
         return media_info
     
+    async def _download_media_limited(self, semaphore: asyncio.Semaphore, message: Any,
+                                      client: Any) -> Optional[Dict[str, Any]]:
+        """Download media while holding a slot of the download worker pool."""
+        async with semaphore:
+            return await self.download_media(message, client=client)
+    
+    async def _finish_stale_takeout(self):
+        """Finish a takeout session left unfinished by an earlier run (e.g. after a crash)."""
+        # Telethon keeps the takeout id in the session file and refuses to
+        # start a new takeout while one is recorded there
+        takeout_id = self.client.session.takeout_id
+        if takeout_id is None:
+            return
+        
+        logger.warning("Finishing a takeout session left over from a previous run")
+        try:
+            await self.client(InvokeWithTakeoutRequest(takeout_id, FinishTakeoutSessionRequest(success=False)))
+        except RPCError as e:
+            logger.debug(f"Could not finish the previous takeout session: {e}")
+        self.client.session.takeout_id = None
+    
+    async def _start_takeout(self, stack: AsyncExitStack) -> Any:
+        """Open a takeout session for the export, or fall back to the regular client."""
+        try:
+            await self._finish_stale_takeout()
+            return await stack.enter_async_context(self.client.takeout(
+                finalize=True, users=True, chats=True, megagroups=True, channels=True,
+                files=True, max_file_size=TAKEOUT_MAX_FILE_SIZE
+            ))
+        except TakeoutInitDelayError as e:
+            logger.warning(f"Takeout session not available for another {e.seconds} seconds, "
+                           f"exporting with regular requests")
+            return self.client
+        except (RPCError, ValueError) as e:
+            logger.warning(f"Could not start a takeout session ({e}), exporting with regular requests")
+            return self.client
+    
     async def export_conversation(self, query: str, limit: Optional[int] = None) -> bool:
         """Export entire conversation with a specific entity."""
         entity = await self.find_conversation(query)
         if not entity:
             return False
         
+        try:
+            # An error inside the takeout block marks the takeout as failed
+            async with AsyncExitStack() as stack:
+                client = await self._start_takeout(stack)
+                await self._export_messages(client, entity, limit)
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error during export: {e}")
+            return False
+    
+    async def _export_messages(self, client: Any, entity: Any, limit: Optional[int]) -> None:
+        """Write all messages of an entity to its export directory and download their media."""
         entity_name = self.get_entity_name(entity)
-        export_dir = self.create_export_directory(entity_name)
         
-        logger.info(f"Starting export for: {entity_name}")
+        # Pick up an unfinished export of this entity where it left off
+        checkpoint = None
+        export_dir = self.find_resumable_export(entity_name, entity.id)
+        if export_dir:
+            checkpoint = load_checkpoint(export_dir)
+            self._set_export_dir(export_dir)
+            if checkpoint["limit"] != limit:
+                logger.warning(f"Keeping the original message limit of the resumed export "
+                               f"({checkpoint['limit'] or 'all messages'}) instead of {limit or 'all messages'}")
+            limit = checkpoint["limit"]
+            min_id = checkpoint["last_id"]
+            message_count = checkpoint["count"]
+            logger.warning(f"Resuming unfinished export for: {entity_name} in {export_dir} after {message_count} messages")
+        else:
+            export_dir = self.create_export_directory(entity_name)
+            message_count = 0
+            # Messages are fetched oldest-first, so a limit needs the id just
+            # before the oldest of the `limit` most recent messages
+            min_id = 0
+            if limit:
+                oldest = await client.get_messages(entity, limit=1, add_offset=limit - 1)
+                if oldest:
+                    min_id = oldest[0].id - 1
+            logger.info(f"Starting export for: {entity_name}")
+        
+        remaining = None if limit is None else max(limit - message_count, 0)
+        reported_bytes = self._bytes_downloaded
+        writer = None
+        
+        # Media downloads run concurrently, bounded to avoid flood-wait errors:
+        # at most DOWNLOAD_CONCURRENCY files and as many chunk requests at once.
+        # Messages wait in `pending` until their media is done so they can be
+        # written in order; the queue is capped to keep memory bounded.
+        semaphore = asyncio.Semaphore(self.config.download_concurrency)
+        self._request_semaphore = asyncio.Semaphore(self.config.download_concurrency)
+        max_pending = self.config.download_concurrency * 4
+        pending = deque()
         
-        messages_data = []
-        message_count = 0
+        async def write_ready(drain: bool = False):
+            while pending:
+                message_data, task = pending[0]
+                if task is not None:
+                    if not (drain or task.done() or len(pending) > max_pending):
+                        break
+                    message_data["media"] = await task
+                pending.popleft()
+                writer.write_message(message_data)
+                if writer.message_count % CHECKPOINT_INTERVAL == 0:
+                    writer.save_checkpoint(entity_id=entity.id, limit=limit)
         
         try:
             # Get conversation info
@@ -248,18 +710,22 @@ class TelegramExporter:
                 "entity_id": entity.id,
                 "entity_name": entity_name,
                 "entity_type": type(entity).__name__,
-                "export_date": datetime.now().isoformat(),
-                "total_messages": 0,
-                "messages": []
+                "export_date": datetime.now().isoformat()
             }
+            writer = ConversationWriter(export_dir, conversation_info, checkpoint)
+            if not checkpoint:
+                writer.last_id = min_id
+                writer.save_checkpoint(entity_id=entity.id, limit=limit)
             
-            # Iterate through all messages
-            client = self._create_client()
-            async for message in client.iter_messages(entity, limit=limit):
+            # Iterate through all messages, oldest first
+            async for message in client.iter_messages(entity, limit=remaining, min_id=min_id, reverse=True):
                 message_count += 1
                 
                 if message_count % 100 == 0:
-                    logger.info(f"Processed {message_count} messages...")
+                    downloaded = self._bytes_downloaded - reported_bytes
+                    reported_bytes = self._bytes_downloaded
+                    logger.info(f"Processed {message_count} messages... "
+                                f"({downloaded / (1024 * 1024):.1f} MB of media downloaded since last update)")
                 
                 # Basic message info
                 message_data = {
@@ -281,43 +747,16 @@ class TelegramExporter:
                         "from_name": getattr(message.forward, 'from_name', None)
                     }
                 
-                # Download and record media
-                media_info = await self.download_media(message, export_dir)
-                if media_info:
-                    message_data["media"] = media_info
-                
-                messages_data.append(message_data)
-            
-            # Update conversation info
-            conversation_info["total_messages"] = message_count
-            conversation_info["messages"] = messages_data
+                # Schedule media download and write out every message that is ready
+                task = None
+                if message.media:
+                    task = asyncio.create_task(self._download_media_limited(semaphore, message, client))
+                pending.append((message_data, task))
+                await write_ready()
             
-            # Save messages data to JSON
-            messages_file = export_dir / "conversation.json"
-            async with aiofiles.open(messages_file, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(conversation_info, indent=2, ensure_ascii=False))
-            
-            # Create a readable text version
-            text_file = export_dir / "conversation.txt"
-            async with aiofiles.open(text_file, 'w', encoding='utf-8') as f:
-                await f.write(f"Conversation with: {entity_name}\n")
-                await f.write(f"Exported on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                await f.write(f"Total messages: {message_count}\n")
-                await f.write("-" * 50 + "\n\n")
-                
-                for msg in reversed(messages_data):  # Show chronological order
-                    date_str = datetime.fromisoformat(msg['date']).strftime('%Y-%m-%d %H:%M:%S') if msg['date'] else 'Unknown'
-                    sender = "You" if msg['is_outgoing'] else entity_name
-                    
-                    await f.write(f"[{date_str}] {sender}: {msg['text']}\n")
-                    
-                    if msg['media']:
-                        await f.write(f"    📎 Media: {msg['media']['type']} - {msg['media']['file_name']}\n")
-                    
-                    if msg['reply_to']:
-                        await f.write(f"    ↩️ Reply to message ID: {msg['reply_to']}\n")
-                    
-                    await f.write("\n")
+            # Wait for outstanding downloads and write the remaining messages
+            await write_ready(drain=True)
+            writer.close()
             
             logger.info(f"Export completed! {message_count} messages exported to {export_dir}")
             logger.info(f"Files saved:")
@@ -325,11 +764,31 @@ class TelegramExporter:
             logger.info(f"  - conversation.txt: Human-readable text format")
             logger.info(f"  - media/: Downloaded attachments organized by type")
             
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error during export: {e}")
-            return False
+        except BaseException:  # Including CancelledError from Ctrl+C
+            # Let cancelled downloads clean up (.part files, borrowed senders)
+            # before the takeout session or client goes away
+            tasks = [task for _, task in pending if task is not None]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if writer is not None:
+                # Everything written so far is consistent, so resume from there
+                writer.save_checkpoint(entity_id=entity.id, limit=limit)
+                writer.close(completed=False)
+            raise
+
+
+def run_async(coro: Any) -> Any:
+    """Run a coroutine on the faster libuv-based event loop where it is available."""
+    try:
+        import uvloop
+    except ImportError:
+        return asyncio.run(coro)
+    if hasattr(uvloop, "run"):
+        return uvloop.run(coro)
+    # uvloop < 0.18 has no run()
+    uvloop.install()
+    return asyncio.run(coro)
 
 
 async def main():
@@ -337,9 +796,11 @@ async def main():
     print("Telegram Conversation Exporter")
     print("=" * 40)
     
-    exporter = TelegramExporter()
+    log_listener = setup_logging()
+    exporter = None
     
     try:
+        exporter = TelegramExporter()
         await exporter.connect()
         
         # Get target conversation
@@ -353,6 +814,7 @@ async def main():
         limit = int(limit_input) if limit_input.isdigit() else None
         
         # Start export
+        print("Exporting... progress is logged to telegram_export.log")
         success = await exporter.export_conversation(query, limit)
         
         if success:
@@ -365,8 +827,10 @@ async def main():
     except Exception as e:
         print(f"\n❌ Error: {e}")
     finally:
-        await exporter.disconnect()
+        if exporter:
+            await exporter.disconnect()
+        log_listener.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    run_async(main())
\ No newline at end of file
@@ -3,39 +3,32 @@
 Test script to verify Telegram connection and list available conversations.
 """
 
-import asyncio
-import os
-from dotenv import load_dotenv
 from telethon import TelegramClient
 from telethon.tl.types import User, Chat, Channel
 
-# Load environment variables
-load_dotenv()
+from telegram_exporter import get_config, run_async
 
 async def test_connection():
     """Test connection to Telegram and list available conversations."""
     
     # Check environment variables
-    api_id = os.getenv('API_ID')
-    api_hash = os.getenv('API_HASH')
-    phone_number = os.getenv('PHONE_NUMBER')
-    session_name = os.getenv('SESSION_NAME', 'telegram_session')
-    
-    if not all([api_id, api_hash, phone_number]):
-        print("❌ Missing required environment variables!")
+    try:
+        config = get_config()
+    except ValueError as e:
+        print(f"❌ {e}")
         print("Please run: python setup.py")
         return
     
     print("Testing Telegram connection...")
-    print(f"API ID: {api_id}")
-    print(f"Phone: {phone_number}")
-    print(f"Session: {session_name}")
+    print(f"API ID: {config.api_id}")
+    print(f"Phone: {config.phone_number}")
+    print(f"Session: {config.session_name}")
     print("-" * 40)
     
     try:
         # Create client and connect
-        client = TelegramClient(session_name, int(api_id), api_hash)
-        await client.start(phone=phone_number)
+        client = TelegramClient(config.session_name, config.api_id, config.api_hash)
+        await client.start(phone=config.phone_number)
         
         print("✅ Successfully connected to Telegram!")
         
@@ -102,4 +95,4 @@ async def test_connection():
         return
 
 if __name__ == "__main__":
-    asyncio.run(test_connection())
\ No newline at end of file
+    run_async(test_connection())
\ No newline at end of file